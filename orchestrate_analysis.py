@@ -1,25 +1,46 @@
 import sys
+import argparse
 import os
 from pathlib import Path # <-- Add Path import
 import logging
 import json
+import io
+import math
+import datetime
+import numbers
+import hashlib
+import tempfile
+import traceback
+import concurrent.futures
+import functools
+from multiprocessing import shared_memory
+import numpy as np
 import pandas as pd
 
 
 # --- Path Setup ---
 # Dynamically add the project root to sys.path if running directly
 # This allows finding the 'backend' package for absolute imports.
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-PROJECT_ROOT = os.path.abspath(os.path.join(SCRIPT_DIR, '..', '..'))
-if PROJECT_ROOT not in sys.path:
-    sys.path.insert(0, PROJECT_ROOT)
+SCRIPT_DIR = Path(__file__).resolve().parent
+PROJECT_ROOT = SCRIPT_DIR.parents[1]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
 # --- End Path Setup ---
 
 
 # --- Import processing, ranking and display functions ---
-from backend.quant_pipelineV2.rank_momentum import get_processed_momentum_results, display_ranking_results as display_momentum_results
+# rank_*_signals are imported once here and shared by process_signals (initial ranking for JSON)
+from backend.quant_pipelineV2.rank_momentum import (
+    get_processed_momentum_results,
+    rank_momentum_signals,
+    display_ranking_results as display_momentum_results,
+)
 # Import reversal processing, ranking and display functions
-from backend.quant_pipelineV2.reversal_rank import get_processed_reversal_results, display_ranking_results as display_reversal_results
+from backend.quant_pipelineV2.reversal_rank import (
+    get_processed_reversal_results,
+    rank_reversal_signals,
+    display_ranking_results as display_reversal_results,
+)
 from backend.quant_pipelineV2.momentum_analysis.momentum_analysis import run_momentum_analysis
 # --- Import Quant Stats Function ---
 from backend.quant_pipelineV2.quant_stats_priceAction import generate_signal_report
@@ -27,10 +48,15 @@ from backend.quant_pipelineV2.quant_stats_priceAction import generate_signal_rep
 
 
 # --- Configuration ---
-OUTPUT_DIR = os.path.join(PROJECT_ROOT, 'data')
-JSON_OUTPUT_PATH = os.path.join(OUTPUT_DIR, 'quant_pipelinev2.json')
+OUTPUT_DIR = PROJECT_ROOT / 'data'
+OUTPUT_DIR.mkdir(parents=True, exist_ok=True) # Created once at import, not on every orchestrate() call
+JSON_OUTPUT_PATH = OUTPUT_DIR / 'quant_pipelinev2.json'
+# Process umask, read once at import (os.umask can only be read by setting it, which is not
+# thread-safe later on). A newly created JSON file gets 0o666 & ~umask, like open(..., 'w').
+_UMASK = os.umask(0)
+os.umask(_UMASK)
 # --- Database Path ---
-DB_DIR = Path(PROJECT_ROOT) / "data"
+DB_DIR = PROJECT_ROOT / "data"
 DB_PATH = DB_DIR / "market_data.db"
 # --- Quant Config (Only needed for generate_signal_report) ---
 QUANT_HORIZONS = [3, 5, 10, 14] # Horizons for quant analysis
@@ -38,6 +64,15 @@ QUANT_SUCCESS_THRESHOLD = 0.04 # Success threshold (e.g., 4%)
 # --- Top N Config ---
 TOP_N_MOMENTUM = 10
 TOP_N_REVERSAL = 5
+# --- Dtype Config ---
+# Opt-in: downcast float64 columns of the indicator data and quant report to float32
+# before ranking (half the memory traffic). Off by default: the rank modules' threshold
+# comparisons can flip (np.float32(0.55) > 0.55) and the JSON loses precision.
+DOWNCAST_FLOATS = False
+# --- Result Cache Config ---
+# Indicator data and the quant report are cached per market_data.db mtime.
+# Set QP_DISABLE_CACHE=1 to force a full recompute.
+CACHE_DIR = OUTPUT_DIR / '_cache'
 # --- Thresholds and Weights are now handled within rank_*.py modules ---
 # MOMENTUM_SCORE_THRESHOLD = 6.0
 # MIN_MATCHES_THRESHOLD = 10
@@ -48,18 +83,364 @@ TOP_N_REVERSAL = 5
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Shared empty-result sentinel for None/error paths of display/JSON results, which are
+# only read (.empty, len(), .head()). Never modify it in place, and never pass it to the
+# rank modules (they may mutate their inputs), e.g. as quant_report_df.
+_EMPTY_DF = pd.DataFrame()
 
 
-def orchestrate():
+def _coerce_df(df):
+    """
+    Normalizes a result from an external pipeline function to a DataFrame (empty if None),
+    so callers only ever need to check `.empty`. Call once where the result is received.
+    """
+    return _EMPTY_DF if df is None else df
+
+
+def _downcast_floats(df):
+    """Returns df with its float64 columns converted to float32 (df itself if there are none)."""
+    float64_cols = df.select_dtypes(include="float64").columns
+    if float64_cols.empty:
+        return df
+    return df.astype({col: "float32" for col in float64_cols})
+
+
+# Raw price/volume columns (compared case-insensitively); everything else numeric is an indicator
+_NON_INDICATOR_COLUMNS = {"open", "high", "low", "close", "adj close", "adj_close", "volume"}
+
+
+def _has_rankable_values(all_indicator_data):
+    """
+    Returns False only if every numeric indicator column (OHLCV columns excluded) is entirely
+    NaN, in which case neither rank module can score anything. A frame without numeric
+    indicator columns counts as rankable.
+    """
+    indicator_cols = [
+        col for col in all_indicator_data.select_dtypes(include="number").columns
+        if str(col).lower() not in _NON_INDICATOR_COLUMNS
+    ]
+    if not indicator_cols:
+        return True
+    return bool(all_indicator_data[indicator_cols].notna().to_numpy().any())
+
+
+def _db_cache_key(*params):
+    """
+    Builds a cache key from the market_data.db mtime plus any extra parameters.
+    Returns None (no caching) if the database file does not exist.
+    """
+    try:
+        db_mtime = DB_PATH.stat().st_mtime
+    except OSError:
+        return None
+    return hashlib.sha1(repr((db_mtime,) + params).encode()).hexdigest()[:16]
+
+
+@functools.cache
+def _pyarrow():
+    """
+    Imports pyarrow (optional, only needed for the Feather indicator cache) on first use,
+    so importing this module as a library does not pay for it.
+    Returns (pyarrow, pyarrow.feather); raises ImportError if pyarrow is not installed.
+    """
+    import pyarrow as pa
+    import pyarrow.feather as pa_feather
+    return pa, pa_feather
+
+
+def _read_cache_file(cache_path):
+    """
+    Reads a cached DataFrame. Feather files are memory-mapped by Arrow, then converted with a
+    plain to_pandas() so the result is a regular, writable frame (the rank modules may modify it).
+    """
+    if cache_path.suffix == ".feather":
+        _, pa_feather = _pyarrow()
+        return pa_feather.read_table(cache_path, memory_map=True).to_pandas()
+    return pd.read_parquet(cache_path)
+
+
+def _write_cache_file(df, cache_path):
+    """Writes df to cache_path as Feather (index kept via Arrow's pandas metadata) or Parquet."""
+    if cache_path.suffix == ".feather":
+        pa, pa_feather = _pyarrow()
+        # Uncompressed so the file can be memory-mapped without a decompression copy
+        pa_feather.write_feather(pa.Table.from_pandas(df), cache_path, compression="uncompressed")
+    else:
+        df.to_parquet(cache_path)
+
+
+def _cached(name, key, builder, fmt="parquet"):
+    """
+    Returns the DataFrame cached as CACHE_DIR/{name}_{key}.{fmt}, or calls builder()
+    and stores its (non-empty) result there, replacing older {name} cache files.
+    fmt is "parquet" (compressed) or "feather" (uncompressed Arrow IPC, fast to load).
+    Caching is skipped when key is None or QP_DISABLE_CACHE=1. Always returns a DataFrame.
+    """
+    if key is None or os.environ.get("QP_DISABLE_CACHE") == "1":
+        return _coerce_df(builder())
+
+    cache_path = CACHE_DIR / f"{name}_{key}.{fmt}"
+    if cache_path.exists():
+        try:
+            df = _read_cache_file(cache_path)
+            logger.info("Loaded cached %s from %s.", name, cache_path)
+            return df
+        except Exception as e:
+            logger.warning("Could not read cache file %s, recomputing: %s", cache_path, e)
+
+    df = _coerce_df(builder())
+    if not df.empty:
+        try:
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            for stale_path in cache_path.parent.glob(f"{name}_*.{fmt}"):
+                stale_path.unlink()
+            _write_cache_file(df, cache_path)
+        except Exception as e:
+            logger.warning("Could not write cache file %s: %s", cache_path, e)
+    return df
+
+
+def process_signals(kind, process_func, rank_func, all_indicator_data, quant_report_df, top_n):
+    """
+    Processes one signal type ("momentum" or "reversal") in a single task.
+    Returns (processed_df, initial_ranked_df): the processed top_n results for display and
+    the initial top_n ranking (pre-processing) for the JSON save. A failure in either part
+    is logged and only that part comes back as an empty DataFrame.
+    Note: rank_func still makes its own full pass over all_indicator_data, on top of the
+    ranking done inside process_func. That duplicate pass remains until the rank_*.py
+    modules can return their intermediate ranking.
+    """
+    try:
+        processed_df = _coerce_df(process_func(
+            all_indicator_data=all_indicator_data,
+            quant_report_df=quant_report_df,
+            top_n=top_n
+        ))
+    except Exception as e:
+        logger.error("Error processing %s signals: %s", kind, e, exc_info=True)
+        processed_df = _EMPTY_DF # Ensure empty on error
+
+    try:
+        # Keep only the top_n rows so the full ranked frame is released right away
+        initial_ranked_df = _coerce_df(rank_func(all_indicator_data)).head(top_n)
+    except Exception as rank_err:
+        logger.error("Error computing initial %s ranking for JSON save: %s", kind, rank_err)
+        initial_ranked_df = _EMPTY_DF
+
+    return processed_df, initial_ranked_df
+
+
+# --- Process-Parallel Support ---
+# shm name -> (SharedMemory, DataFrame), kept per worker process so the mapping stays
+# alive while the frame (whose columns may point into it) is in use.
+_WORKER_SHARED_FRAMES = {}
+
+
+def _share_frame(df):
+    """
+    Serializes df once as an Arrow IPC stream directly into a new SharedMemory block,
+    so process workers can attach to it instead of receiving a pickled copy per task.
+    This avoids pickling, not copies: each worker still converts the stream into its own
+    pandas frame, so process mode holds the parent frame, the IPC stream and one frame
+    per worker at the same time.
+    Returns (shm, size); the caller must close() and unlink() shm when done.
+    """
+    pa, _ = _pyarrow()
+    table = pa.Table.from_pandas(df)
+
+    # Measure the stream first so the shared block can be sized exactly
+    size_probe = pa.MockOutputStream()
+    with pa.ipc.new_stream(size_probe, table.schema) as writer:
+        writer.write_table(table)
+    size = size_probe.size()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        _write_ipc_stream(pa, table, shm)
+    except BaseException as e:
+        # The failed writer's frames (kept alive by the traceback) still hold a view of
+        # shm.buf; clear them so close() can succeed.
+        traceback.clear_frames(e.__traceback__)
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, size
+
+
+def _write_ipc_stream(pa, table, shm):
+    """Writes table into shm. Arrow's view of shm.buf is released on return, so shm can be closed."""
+    with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)), table.schema) as writer:
+        writer.write_table(table)
+
+
+def _attach_shared_frame(shm_name, size):
+    """
+    Worker side of _share_frame: rebuilds the DataFrame from shared memory (once per worker).
+    to_pandas() copies the data into this worker's own frame.
+    """
+    cached = _WORKER_SHARED_FRAMES.get(shm_name)
+    if cached is not None:
+        return cached[1]
+    pa, _ = _pyarrow()
+    shm = shared_memory.SharedMemory(name=shm_name)
+    table = pa.ipc.open_stream(pa.py_buffer(shm.buf)[:size]).read_all()
+    df = table.to_pandas()
+    _WORKER_SHARED_FRAMES[shm_name] = (shm, df)
+    return df
+
+
+def _process_signals_shared(kind, process_func, rank_func, shm_name, size, quant_report_df, top_n):
+    """process_signals() for a process worker, reading all_indicator_data from shared memory."""
+    all_indicator_data = _attach_shared_frame(shm_name, size)
+    return process_signals(kind, process_func, rank_func, all_indicator_data, quant_report_df, top_n)
+
+
+def _signal_task_result(kind, future):
+    """
+    Returns a signal task's (processed_df, initial_ranked_df), or empty frames if the task
+    itself could not run (e.g. a broken process pool).
+    """
+    try:
+        return future.result()
+    except Exception as e:
+        logger.error("Error running %s signal task: %s", kind, e, exc_info=True)
+        return _EMPTY_DF, _EMPTY_DF
+
+
+# Values json.dump serializes natively; anything else (datetime.date, Timestamp, ...) was
+# written via default=str by the original writer.
+_JSON_NATIVE_TYPES = (str, bool, numbers.Number, np.bool_, list, tuple, dict)
+
+
+def _json_ready(df):
+    """
+    Returns df with the values json.dump(default=str) would stringify already converted
+    to str, so DataFrame.to_json writes them as before (e.g. dates as "2024-01-06", not
+    ISO timestamps). JSON-native and missing (None) values are left as they are.
+    With DOWNCAST_FLOATS enabled, float32 columns are upcast via their shortest float32 repr,
+    so 183.42 is written as 183.42 rather than float32's binary value 183.4199981689.
+    """
+    converted = {}
+    for col in df.columns:
+        column = df[col]
+        if column.dtype == object:
+            converted[col] = column.map(lambda v: v if v is None or isinstance(v, _JSON_NATIVE_TYPES) else str(v))
+        elif DOWNCAST_FLOATS and column.dtype == np.float32:
+            converted[col] = column.astype(str).astype("float64")
+        elif pd.api.types.is_datetime64_any_dtype(column) or pd.api.types.is_timedelta64_dtype(column):
+            converted[col] = column.astype(object).map(str)
+    if not converted:
+        return df
+    df = df.copy()
+    for col, column in converted.items():
+        df[col] = column
+    return df
+
+
+def write_json_sections(f, sections, human_readable=False):
+    """
+    Writes {key: DataFrame} to the open text file f as a JSON object of record arrays.
+    Each section is serialized once by DataFrame.to_json; human_readable=True indents
+    the output (indent=4) instead of writing it compactly.
+    Differences from the original json.dump writer: NaN/inf are written as null (json.dump
+    wrote NaN/Infinity), and floats are limited to 15 decimal places. See check_json_roundtrip.
+    """
+    indent = 4 if human_readable else 0
+    newline = "\n" if human_readable else ""
+    pad = " " * indent
+
+    f.write("{")
+    for section_idx, (key, df) in enumerate(sections.items()):
+        # double_precision=15 is pandas' maximum: floats >= 10 round-trip exactly, smaller ones
+        # are cut to 15 decimal places. NaN/inf become null (json.dump wrote NaN/Infinity).
+        records = _json_ready(df).to_json(orient="records", double_precision=15, default_handler=str, indent=indent)
+        if human_readable:
+            # Nest the section's lines one level under the top-level object
+            records = records.replace("\n", "\n" + pad)
+        if section_idx:
+            f.write(",")
+        f.write(f"{newline}{pad}{json.dumps(key)}:{records}")
+    f.write(f"{newline}}}")
+
+
+def _json_values_match(new, old):
+    """Compares one new-writer value with the original writer's, allowing the documented differences."""
+    if isinstance(old, float) and not math.isfinite(old):
+        return new is None # NaN/inf -> null
+    if isinstance(old, float) and isinstance(new, (int, float)) and not isinstance(new, bool):
+        return math.isclose(new, old, rel_tol=1e-15, abs_tol=1e-15) # 15 decimal places
+    return new == old and type(new) is type(old)
+
+
+def check_json_roundtrip():
+    """
+    Checks write_json_sections (compact and human_readable) against the original writer,
+    to_dict(orient="records") + json.dump(default=str), on a sample frame with a
+    datetime.date index level, a datetime column, NaN, np.bool_ and float32 columns.
+    Returns True if json.loads of both outputs agree, up to the differences documented in
+    write_json_sections (and _json_ready, with DOWNCAST_FLOATS); mismatches are logged.
+    """
+    index = pd.MultiIndex.from_tuples(
+        [("AAPL", datetime.date(2024, 1, 6)), ("MSFT", datetime.date(2024, 1, 5))],
+        names=["symbol", "date"]
+    )
+    sample = pd.DataFrame({
+        "close": [183.42, np.nan],
+        "RSI": [0.1234567890123, 99.72],
+        "score": np.array([0.55, 12.5], dtype=np.float32),
+        "flag": np.array([True, False], dtype=np.bool_),
+        "flag_obj": np.array([np.bool_(True), None], dtype=object),
+        "label": ["a", None],
+        "matches": [3, 14],
+        "timestamp": pd.to_datetime(["2024-01-06 00:00:00", "2024-01-05 09:30:00"]),
+    }, index=index).reset_index()
+
+    reference = sample
+    if DOWNCAST_FLOATS:
+        # With the opt-in downcast, float32 columns are written at their shortest repr (see _json_ready)
+        reference = sample.assign(score=sample["score"].astype(str).astype("float64"))
+    expected = json.loads(json.dumps({"rank_momentum_signals": reference.to_dict(orient="records")}, default=str))
+    ok = True
+    for human_readable in (False, True):
+        buf = io.StringIO()
+        write_json_sections(buf, {"rank_momentum_signals": sample}, human_readable=human_readable)
+        actual = json.loads(buf.getvalue())
+        for row_idx, (new_row, old_row) in enumerate(zip(actual["rank_momentum_signals"], expected["rank_momentum_signals"])):
+            for col in old_row.keys() | new_row.keys():
+                if not _json_values_match(new_row.get(col), old_row.get(col)):
+                    logger.warning("JSON mismatch (human_readable=%s) row %d, %s: %r != %r",
+                                   human_readable, row_idx, col, new_row.get(col), old_row.get(col))
+                    ok = False
+        if len(actual["rank_momentum_signals"]) != len(expected["rank_momentum_signals"]):
+            logger.warning("JSON mismatch (human_readable=%s): record count differs.", human_readable)
+            ok = False
+    return ok
+
+
+def orchestrate(human_readable_json=False, parallel="threads"):
     """
     Orchestrates the quantitative analysis pipeline.
     1. Runs momentum analysis (fetches data, calculates indicators).
     2. Generates quant stats report.
     3. Processes momentum signals (ranks, merges, filters, scores, describes).
     4. Processes reversal signals (ranks, merges, filters, scores, describes).
+       Steps 3 and 4 run concurrently; each also computes its initial top-N ranking
+       (a separate rank_*_signals pass, see process_signals).
     5. Displays the top processed results for both momentum and reversal.
     6. Saves the *initial* top ranking results (pre-processing) to a JSON file.
+
+    The JSON file is written compactly unless human_readable_json is True.
+    parallel selects how steps 3 and 4 run concurrently: "threads" (default) gives each
+    thread its own copy of all_indicator_data / quant_report_df; "processes" sidesteps the
+    GIL by handing all_indicator_data to two worker processes once, through shared memory
+    as an Arrow IPC stream (requires pyarrow; each worker still builds its own copy).
+    all_indicator_data is handed to the rank_*.py modules sorted by its [symbol, date]
+    MultiIndex (index.is_monotonic_increasing holds), so they need not re-sort it.
+    With DOWNCAST_FLOATS enabled, the rank_*.py modules receive the indicator data and
+    quant report with float32 (not float64) columns.
     """
+    if parallel not in ("threads", "processes"):
+        raise ValueError(f"parallel must be 'threads' or 'processes', got {parallel!r}")
     logger.info("Starting quantitative analysis orchestration...")
 
     all_indicator_data = None
@@ -74,70 +455,113 @@ def orchestrate():
         logger.info("Running momentum analysis (fetch, indicators, divergences)...")
         # Assumes run_momentum_analysis returns all_indicator_data with MultiIndex [symbol, date]
         # and date level is datetime.date or compatible.
-        _, all_indicator_data = run_momentum_analysis()
-
-        if all_indicator_data is None or all_indicator_data.empty:
+        all_indicator_data = _cached(
+            "all_indicator_data",
+            _db_cache_key(),
+            lambda: run_momentum_analysis()[1],
+            fmt="feather"
+        )
+
+        if all_indicator_data.empty:
             logger.warning("Momentum analysis did not return indicator data. Stopping.")
             return
         # Basic index check (more robust checks happen inside processing functions)
         if not isinstance(all_indicator_data.index, pd.MultiIndex) or len(all_indicator_data.index.names) != 2:
             logger.error("all_indicator_data does not have the expected MultiIndex. Stopping.")
             return
+        # Sort once here so every consumer gets pandas' lexsorted-MultiIndex fast paths
+        if not all_indicator_data.index.is_monotonic_increasing:
+            all_indicator_data = all_indicator_data.sort_index()
+
+        if DOWNCAST_FLOATS:
+            all_indicator_data = _downcast_floats(all_indicator_data)
 
         logger.info("Momentum analysis completed successfully.")
 
-        # 2. Generate Quant Stats Report
-        logger.info("Generating quant statistics report...")
-        try:
-            quant_report_df = generate_signal_report(
-                db_path=DB_PATH,
-                future_horizons=QUANT_HORIZONS,
-                success_threshold=QUANT_SUCCESS_THRESHOLD
-            )
-            if quant_report_df is None or quant_report_df.empty:
-                 logger.warning("Quant report generation returned empty or failed.")
-                 quant_report_df = pd.DataFrame() # Ensure it's an empty DF
-            else:
-                 logger.info(f"Quant report generated with {len(quant_report_df)} entries.")
-        except Exception as e:
-            logger.error(f"Error during generate_signal_report: {e}", exc_info=True)
-            quant_report_df = pd.DataFrame() # Ensure empty DF on error
+        # Skip steps 2-4 entirely if no row has any indicator value to score
+        if not _has_rankable_values(all_indicator_data):
+            logger.warning("All indicator values are NaN; skipping quant report and signal processing.")
+            momentum_display_df = reversal_display_df = _EMPTY_DF
+            initial_momentum_ranked_data = initial_reversal_ranked_data = _EMPTY_DF
+        else:
+            # 2. Generate Quant Stats Report
+            logger.info("Generating quant statistics report...")
+            try:
+                quant_report_df = _cached(
+                    "quant_report",
+                    _db_cache_key(tuple(QUANT_HORIZONS), QUANT_SUCCESS_THRESHOLD),
+                    lambda: generate_signal_report(
+                        db_path=DB_PATH,
+                        future_horizons=QUANT_HORIZONS,
+                        success_threshold=QUANT_SUCCESS_THRESHOLD
+                    )
+                )
+                if quant_report_df.empty:
+                     logger.warning("Quant report generation returned empty or failed.")
+                     quant_report_df = pd.DataFrame() # Fresh frame: it is handed to the rank modules
+                else:
+                     if DOWNCAST_FLOATS:
+                         quant_report_df = _downcast_floats(quant_report_df)
+                     logger.info("Quant report generated with %d entries.", len(quant_report_df))
+            except Exception as e:
+                logger.error("Error during generate_signal_report: %s", e, exc_info=True)
+                quant_report_df = pd.DataFrame() # Ensure empty DF on error (fresh, see _EMPTY_DF)
+
+            # --- Process Signals (using dedicated functions from rank_*.py) ---
+
+            # 3./4. Process Momentum and Reversal Signals concurrently.
+            # Each task also yields its initial (pre-processing) top-N ranking for the JSON save.
+            # The rank modules may modify their inputs in place, so every task gets its own
+            # all_indicator_data / quant_report_df (copies for threads, per-process frames otherwise).
+            logger.info("Processing top %d momentum and top %d reversal signals...", TOP_N_MOMENTUM, TOP_N_REVERSAL)
+            shared_frame = None
+            if parallel == "processes":
+                try:
+                    shared_frame = _share_frame(all_indicator_data)
+                except Exception as e:
+                    logger.warning("Could not share indicator data with worker processes, using threads: %s", e)
 
-        # --- Process Signals (using dedicated functions from rank_*.py) ---
+            try:
+                if shared_frame is not None:
+                    shm, shm_size = shared_frame
+                    executor = concurrent.futures.ProcessPoolExecutor(max_workers=2)
+                    signal_task = _process_signals_shared
+                    momentum_args = reversal_args = (shm.name, shm_size, quant_report_df)
+                else:
+                    executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+                    signal_task = process_signals
+                    momentum_args = (all_indicator_data.copy(), quant_report_df.copy())
+                    reversal_args = (all_indicator_data.copy(), quant_report_df.copy())
+
+                with executor:
+                    momentum_future = executor.submit(
+                        signal_task, "momentum",
+                        get_processed_momentum_results, rank_momentum_signals,
+                        *momentum_args, TOP_N_MOMENTUM
+                        # Uses default thresholds defined in rank_momentum.py
+                    )
+                    reversal_future = executor.submit(
+                        signal_task, "reversal",
+                        get_processed_reversal_results, rank_reversal_signals,
+                        *reversal_args, TOP_N_REVERSAL
+                        # Uses default thresholds defined in reversal_rank.py
+                    )
+                    momentum_display_df, initial_momentum_ranked_data = _signal_task_result("momentum", momentum_future)
+                    reversal_display_df, initial_reversal_ranked_data = _signal_task_result("reversal", reversal_future)
+            finally:
+                if shared_frame is not None:
+                    shm.close()
+                    shm.unlink()
 
-        # 3. Process Momentum Signals
-        logger.info(f"Processing top {TOP_N_MOMENTUM} momentum signals...")
-        try:
-            momentum_display_df = get_processed_momentum_results(
-                all_indicator_data=all_indicator_data,
-                quant_report_df=quant_report_df,
-                top_n=TOP_N_MOMENTUM
-                # Uses default thresholds defined in rank_momentum.py
-            )
             if momentum_display_df.empty:
                  logger.warning("Momentum processing returned no displayable results.")
             else:
-                 logger.info(f"Momentum processing complete. Found {len(momentum_display_df)} signals for display.")
-        except Exception as e:
-            logger.error(f"Error processing momentum signals: {e}", exc_info=True)
-            momentum_display_df = pd.DataFrame() # Ensure empty on error
+                 logger.info("Momentum processing complete. Found %d signals for display.", len(momentum_display_df))
 
-        # 4. Process Reversal Signals
-        logger.info(f"Processing top {TOP_N_REVERSAL} reversal signals...")
-        try:
-            reversal_display_df = get_processed_reversal_results(
-                all_indicator_data=all_indicator_data,
-                quant_report_df=quant_report_df,
-                top_n=TOP_N_REVERSAL
-                # Uses default thresholds defined in reversal_rank.py
-            )
             if reversal_display_df.empty:
                  logger.warning("Reversal processing returned no displayable results.")
             else:
-                 logger.info(f"Reversal processing complete. Found {len(reversal_display_df)} signals for display.")
-        except Exception as e:
-            logger.error(f"Error processing reversal signals: {e}", exc_info=True)
-            reversal_display_df = pd.DataFrame() # Ensure empty on error
+                 logger.info("Reversal processing complete. Found %d signals for display.", len(reversal_display_df))
 
         # 5. Display Results
         if not momentum_display_df.empty:
@@ -152,61 +576,68 @@ def orchestrate():
         else:
             logger.info("No reversal results to display.")
 
-        # 6. Save *initial* results to JSON (Requires re-running initial rank)
-        # We need the initial ranks just for saving, as requested.
-        logger.info("Re-running initial ranking for JSON save...")
-        try:
-            from backend.quant_pipelineV2.rank_momentum import rank_momentum_signals as initial_rank_momentum
-            from backend.quant_pipelineV2.reversal_rank import rank_reversal_signals as initial_rank_reversal
-
-            initial_momentum_ranked_data = initial_rank_momentum(all_indicator_data)
-            initial_reversal_ranked_data = initial_rank_reversal(all_indicator_data)
-        except Exception as rank_err:
-            logger.error(f"Error re-running initial ranking for JSON save: {rank_err}")
-            initial_momentum_ranked_data = None
-            initial_reversal_ranked_data = None
-
-        if (initial_momentum_ranked_data is not None and not initial_momentum_ranked_data.empty) or \
-           (initial_reversal_ranked_data is not None and not initial_reversal_ranked_data.empty):
+        # 6. Save *initial* results to JSON (collected alongside steps 3/4)
+        if not initial_momentum_ranked_data.empty or not initial_reversal_ranked_data.empty:
 
-            logger.info(f"Attempting to save *initial* ranking results to {JSON_OUTPUT_PATH}...")
+            logger.info("Attempting to save *initial* ranking results to %s...", JSON_OUTPUT_PATH)
             try:
-                os.makedirs(OUTPUT_DIR, exist_ok=True)
-                output_dict = {}
-
-                if isinstance(initial_momentum_ranked_data, pd.DataFrame) and not initial_momentum_ranked_data.empty:
-                    momentum_top = initial_momentum_ranked_data.head(TOP_N_MOMENTUM)
-                    momentum_for_json = momentum_top.reset_index()
-                    output_dict["rank_momentum_signals"] = momentum_for_json.to_dict(orient="records")
-                    logger.info(f"Prepared top {TOP_N_MOMENTUM} *initial* momentum signals for JSON.")
+                # Flattened ([symbol, date] index -> columns) exactly once per ranking;
+                # reuse these frames for any additional output format rather than re-flattening.
+                ranking_sections = {}
+
+                if not initial_momentum_ranked_data.empty:
+                    momentum_flat = initial_momentum_ranked_data.reset_index()
+                    ranking_sections["rank_momentum_signals"] = momentum_flat
+                    logger.info("Prepared top %d *initial* momentum signals for JSON.", TOP_N_MOMENTUM)
                 else:
                     logger.info("No initial momentum data to save to JSON.")
 
-                if isinstance(initial_reversal_ranked_data, pd.DataFrame) and not initial_reversal_ranked_data.empty:
-                    reversal_top = initial_reversal_ranked_data.head(TOP_N_REVERSAL)
-                    reversal_for_json = reversal_top.reset_index()
-                    output_dict["rank_reversal_signals"] = reversal_for_json.to_dict(orient="records")
-                    logger.info(f"Prepared top {TOP_N_REVERSAL} *initial* reversal signals for JSON.")
+                if not initial_reversal_ranked_data.empty:
+                    reversal_flat = initial_reversal_ranked_data.reset_index()
+                    ranking_sections["rank_reversal_signals"] = reversal_flat
+                    logger.info("Prepared top %d *initial* reversal signals for JSON.", TOP_N_REVERSAL)
                 else:
                      logger.info("No initial reversal data to save to JSON.")
 
-                if output_dict:
-                    with open(JSON_OUTPUT_PATH, 'w') as f:
-                        json.dump(output_dict, f, indent=4, default=str)
-                    logger.info(f"Successfully saved *initial* ranking results to {JSON_OUTPUT_PATH}.")
+                if ranking_sections:
+                    # Write to a temp file and atomically swap it in, so readers never see a partial file.
+                    # The temp name is unique per run, so overlapping runs cannot clobber each other's file.
+                    tmp_json_path = None
+                    try:
+                        with tempfile.NamedTemporaryFile('w', dir=OUTPUT_DIR, prefix=JSON_OUTPUT_PATH.name + ".",
+                                                         suffix=".tmp", delete=False) as f:
+                            tmp_json_path = Path(f.name)
+                            write_json_sections(f, ranking_sections, human_readable=human_readable_json)
+                        # NamedTemporaryFile creates the file as 0600: keep the existing file's mode,
+                        # or use the umask-based default open(..., 'w') would give a new file
+                        tmp_json_path.chmod(JSON_OUTPUT_PATH.stat().st_mode & 0o777 if JSON_OUTPUT_PATH.exists() else 0o666 & ~_UMASK)
+                        tmp_json_path.replace(JSON_OUTPUT_PATH)
+                    finally:
+                        if tmp_json_path is not None:
+                            tmp_json_path.unlink(missing_ok=True)
+                    logger.info("Successfully saved *initial* ranking results to %s.", JSON_OUTPUT_PATH)
                 else:
                     logger.info("No initial ranking data was generated to save.")
 
             except Exception as json_e:
-                logger.error(f"Failed to save initial results to JSON: {json_e}", exc_info=True)
+                logger.error("Failed to save initial results to JSON: %s", json_e, exc_info=True)
         else:
              logger.info("No initial ranking data was generated. Skipping JSON save.")
 
         logger.info("Quantitative analysis orchestration finished.")
 
     except Exception as e:
-        logger.error(f"An error occurred during orchestration: {e}", exc_info=True)
+        logger.error("An error occurred during orchestration: %s", e, exc_info=True)
 
 
 if __name__ == "__main__":
-    orchestrate()
+    parser = argparse.ArgumentParser(description="Run the quant_pipelineV2 analysis orchestration.")
+    parser.add_argument("--human", action="store_true", help="Pretty-print the JSON output (indent=4).")
+    parser.add_argument("--parallel", choices=("threads", "processes"), default="threads",
+                        help="Run momentum/reversal processing in threads (default) or worker processes.")
+    parser.add_argument("--check-json", action="store_true",
+                        help="Only check the JSON writer against the original json.dump output, then exit.")
+    args = parser.parse_args()
+    if args.check_json:
+        sys.exit(0 if check_json_roundtrip() else 1)
+    orchestrate(human_readable_json=args.human, parallel=args.parallel)